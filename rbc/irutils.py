@@ -22,10 +22,10 @@ def get_or_insert_function(module, fnty, name=None):
 
 
 def get_member_value(builder, data, idx):
-    if get_version('numba') >= (0, 54):
-        assert data.opname == 'insertvalue', data.opname
+    if isinstance(data.type, ir.LiteralStructType):
+        # the aggregate is available as a value, extracting the
+        # member avoids another memory access
         return builder.extract_value(data, [idx])
-    else:
-        assert data.opname == 'load', data.opname
-        struct = data.operands[0]
-        return builder.load(builder.gep(struct, [int32_t(0), int32_t(idx)]))
+    assert data.opname == 'load', data.opname
+    struct = data.operands[0]
+    return builder.load(builder.gep(struct, [int32_t(0), int32_t(idx)]))
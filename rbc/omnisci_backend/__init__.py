@@ -1,5 +1,6 @@
 from .numpy_funcs import *  # noqa: F401, F403
 from .npyimpl import *  # noqa: F401, F403
+from .omnisci_buffer import *  # noqa: F401, F403
 from .omnisci_array import *  # noqa: F401, F403
 from .omnisci_column import *  # noqa: F401, F403
 from .omnisci_bytes import *  # noqa: F401, F403
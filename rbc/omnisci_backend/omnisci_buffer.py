@@ -22,16 +22,16 @@ to provide a minimal functionality for accessing and manipulating the
 Omnisci buffer objects from UDF/UDTFs.
 """
 
+__all__ = ['free_buffer']
 
 import operator
-from collections import defaultdict
+import functools
+import weakref
 from .omnisci_metatype import OmnisciMetaType
 from llvmlite import ir
-import numpy as np
 from rbc import typesystem, irutils
 from rbc.targetinfo import TargetInfo
-from llvmlite import ir as llvm_ir
-from numba.core import datamodel, cgutils, extending, types
+from numba.core import datamodel, cgutils, errors, extending, types, typing
 
 
 int8_t = ir.IntType(8)
@@ -42,6 +42,12 @@ fp32 = ir.FloatType()
 fp64 = ir.DoubleType()
 
 
+# Maps the element type, extra members, passing convention, and the
+# size of size_t to the numba type of Omnisci buffers. See
+# OmnisciBufferType.tonumba.
+buffer_numba_types = {}
+
+
 class OmnisciBufferType(typesystem.Type):
     """Typesystem type class for Omnisci buffer structures.
     """
@@ -69,6 +75,12 @@ class OmnisciBufferType(typesystem.Type):
         return ()
 
     def tonumba(self, bool_is_int8=None):
+        # size_t is normalized according to the current target
+        key = (self.element_type, self.buffer_extra_members, self.pass_by_value,
+               TargetInfo().sizeof('size_t'))
+        numba_type = buffer_numba_types.get(key)
+        if numba_type is not None:
+            return numba_type
         ptr_t = typesystem.Type(self.element_type, '*', name='ptr')
         size_t = typesystem.Type.fromstring('size_t sz')
         extra_members = tuple(map(typesystem.Type.fromobject, self.buffer_extra_members))
@@ -80,9 +92,10 @@ class OmnisciBufferType(typesystem.Type):
         buffer_type._params['NumbaType'] = BufferType
         buffer_type._params['NumbaPointerType'] = BufferPointer
         numba_type = buffer_type.tonumba(bool_is_int8=True)
-        if self.pass_by_value:
-            return numba_type
-        return BufferPointer(numba_type)
+        if not self.pass_by_value:
+            numba_type = BufferPointer(numba_type)
+        buffer_numba_types[key] = numba_type
+        return numba_type
 
 
 class BufferType(types.Type):
@@ -139,7 +152,94 @@ class BufferPointerModel(datamodel.models.PointerModel):
     """
 
 
-builder_buffers = defaultdict(list)
+# Maps IR builders to the lists of pointers to the buffer structures
+# that are created within the UDF/UDTF being lowered. The entries are
+# released by free_omnisci_buffer or, if it is never called, when the
+# builder is garbage collected.
+builder_buffers = weakref.WeakKeyDictionary()
+
+
+def _tbaa_tag(module, name):
+    """Return the TBAA access tag for the given kind of memory accesses.
+
+    The buffer structure members and the buffer elements never overlap
+    in memory. Tagging the corresponding loads and stores lets LLVM
+    know that storing an element does not modify the buffer data
+    pointer so that its load can be hoisted out of loops.
+    """
+    root = module.add_metadata(['rbc buffer TBAA'])
+    node = module.add_metadata([name, root, int64_t(0)])
+    return module.add_metadata([node, node, int64_t(0)])
+
+
+def _load_buffer_member(builder, data, idx):
+    """Return the value of idx-th member of the Omnisci buffer structure
+    that is pointed to by data.
+    """
+    value = builder.load(builder.gep(data, [int32_t(0), int32_t(idx)]))
+    value.set_metadata('tbaa', _tbaa_tag(builder.module, 'buffer member'))
+    return value
+
+
+def _store_buffer_member(builder, value, data, idx):
+    """Store value as the idx-th member of the Omnisci buffer structure
+    that is pointed to by data.
+    """
+    instr = builder.store(value, builder.gep(data, [int32_t(0), int32_t(idx)]))
+    instr.set_metadata('tbaa', _tbaa_tag(builder.module, 'buffer member'))
+
+
+def _load_buffer_element(builder, ptr, index):
+    """Return the index-th element of the buffer data ptr.
+    """
+    value = builder.load(builder.gep(ptr, [index]))
+    value.set_metadata('tbaa', _tbaa_tag(builder.module, 'buffer element'))
+    return value
+
+
+def _store_buffer_element(builder, value, ptr, index):
+    """Store value as the index-th element of the buffer data ptr.
+    """
+    instr = builder.store(value, builder.gep(ptr, [index]))
+    instr.set_metadata('tbaa', _tbaa_tag(builder.module, 'buffer element'))
+
+
+def get_buffer_alloc_fn(module):
+    """Return the declaration of the function that allocates the memory
+    of buffers created within UDF/UDTFs:
+
+      int8_t* allocate_varlen_buffer(int64_t element_count, int64_t element_size)
+
+    The allocator is provided by the omniscidb runtime.
+    """
+    alloc_fnty = ir.FunctionType(int8_t.as_pointer(), [int64_t, int64_t])
+    alloc_fn = irutils.get_or_insert_function(module, alloc_fnty, "allocate_varlen_buffer")
+    # The allocator returns fresh malloc-ed memory that is not
+    # aliased by any other pointer and is suitably aligned for any
+    # buffer element type. Letting LLVM know about this enables
+    # optimizing (e.g. vectorizing) the loops that fill the buffer.
+    alloc_fn.return_value.add_attribute('noalias')
+    alloc_fn.return_value.attributes.align = 8
+    return alloc_fn
+
+
+def get_buffer_free_fn(module):
+    """Return the declaration of the function that releases the memory
+    allocated by the function returned from `get_buffer_alloc_fn`:
+
+      void free(int8_t* ptr)
+    """
+    # TODO: using stdlib `free` that works only for CPU. For CUDA
+    # devices, we need to use omniscidb provided deallocator.
+    free_fnty = ir.FunctionType(void_t, [int8_t.as_pointer()])
+    return irutils.get_or_insert_function(module, free_fnty, "free")
+
+
+@functools.lru_cache(maxsize=None)
+def get_element_size_constant(dtype):
+    """Return the size of buffer element type in bytes as an LLVM constant.
+    """
+    return int64_t(dtype.bitwidth // 8)
 
 
 def omnisci_buffer_constructor(context, builder, sig, args):
@@ -162,29 +262,28 @@ def omnisci_buffer_constructor(context, builder, sig, args):
         null_type = None
     assert isinstance(args[0].type, ir.IntType), (args[0].type)
     element_count = builder.zext(args[0], int64_t)
-    element_size = int64_t(ptr_type.dtype.bitwidth // 8)
-
-    alloc_fnty = ir.FunctionType(int8_t.as_pointer(), [int64_t, int64_t])
+    element_size = get_element_size_constant(ptr_type.dtype)
 
-    alloc_fn = irutils.get_or_insert_function(builder.module, alloc_fnty, "allocate_varlen_buffer")
+    alloc_fn = get_buffer_alloc_fn(builder.module)
     ptr8 = builder.call(alloc_fn, [element_count, element_size])
-    # remember possible temporary allocations so that when leaving a
-    # UDF/UDTF, these will be deallocated, see omnisci_pipeline.py.
-    builder_buffers[builder].append(ptr8)
     ptr = builder.bitcast(ptr8, context.get_value_type(ptr_type))
 
-    fa = cgutils.create_struct_proxy(sig.return_type.dtype)(context, builder)
-    fa.ptr = ptr                  # T*
-    fa.sz = element_count         # size_t
+    members = [ptr,               # T*
+               element_count]     # size_t
     if null_type is not None:
-        is_zero = builder.icmp_signed('==', element_count, int64_t(0))
-        with builder.if_else(is_zero) as (then, orelse):
-            with then:
-                is_null = context.get_value_type(null_type)(1)
-            with orelse:
-                is_null = context.get_value_type(null_type)(0)
-        fa.is_null = is_null      # int8_t
-    return fa._getpointer()
+        is_null = context.get_value_type(null_type)(0)
+        members.append(is_null)   # int8_t
+
+    # Initialize the buffer structure with a single store of the
+    # aggregate value rather than storing its members one by one
+    struct_ptr = cgutils.alloca_once(builder, context.get_data_type(sig.return_type.dtype))
+    builder.store(cgutils.pack_struct(builder, members), struct_ptr)
+    # remember possible temporary allocations so that when leaving a
+    # UDF/UDTF, these will be deallocated, see omnisci_pipeline.py.
+    # The buffer data pointer is read at the exit so that the buffers
+    # that are freed explicitly are not deallocated again.
+    builder_buffers.setdefault(builder, []).append(struct_ptr)
+    return struct_ptr
 
 
 @extending.intrinsic
@@ -192,31 +291,84 @@ def free_omnisci_buffer(typingctx, ret):
     sig = types.void(ret)
 
     def codegen(context, builder, signature, args):
-        buffers = builder_buffers[builder]
+        buffers = builder_buffers.pop(builder, [])
+        if not buffers:
+            return
 
-        # TODO: using stdlib `free` that works only for CPU. For CUDA
-        # devices, we need to use omniscidb provided deallocator.
-        free_fnty = llvm_ir.FunctionType(void_t, [int8_t.as_pointer()])
-        free_fn = irutils.get_or_insert_function(builder.module, free_fnty, "free")
+        free_fn = get_buffer_free_fn(builder.module)
 
         # We skip the ret pointer iff we're returning a Buffer
         # otherwise, we free everything
         if isinstance(ret, BufferPointer):
             [arg] = args
-            ptr = builder.load(builder.gep(arg, [int32_t(0), int32_t(0)]))
-            ptr = builder.bitcast(ptr, int8_t.as_pointer())
-            for ptr8 in buffers:
-                with builder.if_then(builder.icmp_signed('!=', ptr, ptr8)):
-                    builder.call(free_fn, [ptr8])
+            skip = builder.bitcast(_load_buffer_member(builder, arg, 0),
+                                   int8_t.as_pointer())
         else:
-            for ptr8 in buffers:
+            skip = None
+
+        # The data pointers are loaded from the buffer structures so
+        # that the buffers freed explicitly (these have NULL data
+        # pointer) are not deallocated again.
+        for struct_ptr in buffers:
+            ptr = _load_buffer_member(builder, struct_ptr, 0)
+            ptr8 = builder.bitcast(ptr, int8_t.as_pointer())
+            if skip is None:
                 builder.call(free_fn, [ptr8])
+            else:
+                with builder.if_then(builder.icmp_unsigned('!=', ptr8, skip)):
+                    builder.call(free_fn, [ptr8])
+
+    return sig, codegen
+
+
+@extending.intrinsic
+def omnisci_buffer_free_(typingctx, data):
+    sig = types.none(data)
+
+    def codegen(context, builder, signature, args):
+        data, = args
+        ptr = _load_buffer_member(builder, data, 0)
 
-        del builder_buffers[builder]
+        # reset the buffer so that it is empty when used or returned
+        # after freeing, and its memory is not deallocated again when
+        # leaving the UDF/UDTF. The size and the data pointer are
+        # stored on different sides of the free call, otherwise, LLVM
+        # combines the stores into llvm.memset that is not supported
+        # by omniscidb.
+        sz_type = data.type.pointee.elements[1]
+        _store_buffer_member(builder, sz_type(0), data, 1)
+
+        free_fn = get_buffer_free_fn(builder.module)
+        builder.call(free_fn, [builder.bitcast(ptr, int8_t.as_pointer())])
+
+        _store_buffer_member(builder, ptr.type(None), data, 0)
 
     return sig, codegen
 
 
+def free_buffer(buf):
+    """
+    Free the memory of a buffer that is created within UDF/UDTF.
+
+    Only the buffers that are constructed within the UDF/UDTF may be
+    freed, the memory of the buffers passed in as arguments is owned
+    by omniscidb. The freed buffer becomes empty. Freeing buffers is
+    supported only on CPU targets.
+    """
+    raise NotImplementedError('free_buffer can be used only within UDF/UDTFs')
+
+
+@extending.overload(free_buffer)
+@extending.overload_method(BufferPointer, 'free')
+def omnisci_buffer_free(buf):
+    if not TargetInfo().is_cpu:
+        raise errors.TypingError('freeing buffers is supported only on CPU targets')
+    if isinstance(buf, BufferPointer):
+        def impl(buf):
+            return omnisci_buffer_free_(buf)
+        return impl
+
+
 @extending.intrinsic
 def omnisci_buffer_ptr_get_ptr_(typingctx, data):
     eltype = data.eltype
@@ -225,10 +377,7 @@ def omnisci_buffer_ptr_get_ptr_(typingctx, data):
 
     def codegen(context, builder, signature, args):
         data,  = args
-        rawptr = cgutils.alloca_once_value(builder, value=data)
-        struct = builder.load(builder.gep(rawptr,
-                                          [int32_t(0)]))
-        return builder.load(builder.gep(struct, [int32_t(0), int32_t(0)]))
+        return _load_buffer_member(builder, data, 0)
 
     return sig, codegen
 
@@ -256,9 +405,7 @@ def omnisci_buffer_ptr_item_get_ptr_(typingctx, data, index):
 
     def codegen(context, builder, signature, args):
         data, index = args
-        rawptr = cgutils.alloca_once_value(builder, value=data)
-        struct = builder.load(builder.gep(rawptr, [int32_t(0)]))
-        ptr = builder.load(builder.gep(struct, [int32_t(0), int32_t(0)]))
+        ptr = _load_buffer_member(builder, data, 0)
         return builder.gep(ptr, [index])
 
     return sig, codegen
@@ -283,75 +430,63 @@ def omnisci_buffer_get_ptr(x, index=None):
         return impl
 
 
-@extending.intrinsic
-def omnisci_buffer_ptr_len_(typingctx, data):
-    sig = types.int64(data)
+@typing.templates.infer_global(len)
+class BufferLenTemplate(typing.templates.AbstractTemplate):
 
-    def codegen(context, builder, signature, args):
-        data, = args
-        rawptr = cgutils.alloca_once_value(builder, value=data)
-        struct = builder.load(builder.gep(rawptr,
-                                          [int32_t(0)]))
-        return builder.load(builder.gep(
-            struct, [int32_t(0), int32_t(1)]))
-    return sig, codegen
-
-
-@extending.intrinsic
-def omnisci_buffer_len_(typingctx, data):
-    sig = types.int64(data)
-
-    def codegen(context, builder, signature, args):
-        data, = args
-        return irutils.get_member_value(builder, data, 1)
+    def generic(self, args, kws):
+        if len(args) == 1 and not kws:
+            [x] = args
+            if isinstance(x, (BufferPointer, BufferType)):
+                return types.int64(x)
 
-    return sig, codegen
 
+@extending.lower_builtin(len, BufferPointer)
+def omnisci_buffer_ptr_len_(context, builder, sig, args):
+    data, = args
+    return _load_buffer_member(builder, data, 1)
 
-@extending.overload(len)
-def omnisci_buffer_len(x):
-    if isinstance(x, BufferPointer):
-        return lambda x: omnisci_buffer_ptr_len_(x)
-    if isinstance(x, BufferType):
-        return lambda x: omnisci_buffer_len_(x)
 
+@extending.lower_builtin(len, BufferType)
+def omnisci_buffer_len_(context, builder, sig, args):
+    data, = args
+    return irutils.get_member_value(builder, data, 1)
 
-@extending.intrinsic
-def omnisci_buffer_ptr_getitem_(typingctx, data, index):
-    sig = data.eltype(data, index)
 
-    def codegen(context, builder, signature, args):
-        data, index = args
-        rawptr = cgutils.alloca_once_value(builder, value=data)
-        buf = builder.load(builder.gep(rawptr, [int32_t(0)]))
-        ptr = builder.load(builder.gep(
-            buf, [int32_t(0), int32_t(0)]))
-        res = builder.load(builder.gep(ptr, [index]))
+@typing.templates.infer_global(operator.getitem)
+class BufferGetItemTemplate(typing.templates.AbstractTemplate):
 
-        return res
-    return sig, codegen
+    def generic(self, args, kws):
+        if len(args) == 2 and not kws:
+            x, i = args
+            if isinstance(x, (BufferPointer, BufferType)) and isinstance(i, types.Integer):
+                return x.eltype(x, types.unliteral(i))
 
 
-@extending.intrinsic
-def omnisci_buffer_getitem_(typingctx, data, index):
-    eltype = data.eltype
-    sig = eltype(data, index)
+@extending.lower_builtin(operator.getitem, BufferPointer, types.Integer)
+def omnisci_buffer_ptr_getitem_(context, builder, sig, args):
+    data, index = args
+    ptr = _load_buffer_member(builder, data, 0)
+    return _load_buffer_element(builder, ptr, index)
 
-    def codegen(context, builder, signature, args):
-        data, index = args
-        ptr = irutils.get_member_value(builder, data, 0)
-        res = builder.load(builder.gep(ptr, [index]))
 
-        return res
-    return sig, codegen
+@extending.lower_builtin(operator.getitem, BufferType, types.Integer)
+def omnisci_buffer_getitem_(context, builder, sig, args):
+    data, index = args
+    ptr = irutils.get_member_value(builder, data, 0)
+    return _load_buffer_element(builder, ptr, index)
 
 
-@extending.overload(operator.getitem)
-def omnisci_buffer_getitem(x, i):
-    if isinstance(x, BufferPointer):
-        return lambda x, i: omnisci_buffer_ptr_getitem_(x, i)
-    if isinstance(x, BufferType):
-        return lambda x, i: omnisci_buffer_getitem_(x, i)
+# Maps the kind of a stored value and the direction of its cast to
+# the name of the corresponding IRBuilder method
+_cast_ops = {
+    (types.Integer, 'narrow'): 'trunc',
+    (types.Integer, 'widen_signed'): 'sext',
+    (types.Integer, 'widen_unsigned'): 'zext',
+    (types.Float, 'narrow'): 'fptrunc',
+    (types.Float, 'widen'): 'fpext',
+    (types.Boolean, 'narrow'): 'trunc',
+    (types.Boolean, 'widen'): 'zext',
+}
 
 
 # [rbc issue-197] Numba promotes operations like
@@ -359,72 +494,52 @@ def omnisci_buffer_getitem(x, i):
 def truncate_or_extend(builder, nb_value, eltype, value, buf_typ):
     # buf[pos] = val
 
-    if isinstance(nb_value, types.Integer):  # Integer
-        if eltype.bitwidth < nb_value.bitwidth:
-            return builder.trunc(value, buf_typ)  # truncate
-        elif eltype.bitwidth > nb_value.bitwidth:
-            is_signed = nb_value.signed
-            return builder.sext(value, buf_typ) if is_signed else \
-                builder.zext(value, buf_typ)  # extend
-    elif isinstance(nb_value, types.Float):  # Floating-point
-        if eltype.bitwidth < nb_value.bitwidth:
-            return builder.fptrunc(value, buf_typ)  # truncate
-        elif eltype.bitwidth > nb_value.bitwidth:
-            return builder.fpext(value, buf_typ)  # extend
-    elif isinstance(nb_value, types.Boolean):
-        if buf_typ.width < value.type.width:
-            return builder.trunc(value, buf_typ)
-        elif buf_typ.width > value.type.width:
-            return builder.zext(value, buf_typ)
-
-    return value
-
-
-@extending.intrinsic
-def omnisci_buffer_ptr_setitem_(typingctx, data, index, value):
-    sig = types.none(data, index, value)
-
-    eltype = data.eltype
-    nb_value = value
-
-    def codegen(context, builder, signature, args):
-        zero = int32_t(0)
-
-        data, index, value = args
-
-        rawptr = cgutils.alloca_once_value(builder, value=data)
-        ptr = builder.load(rawptr)
-
-        buf = builder.load(builder.gep(ptr, [zero, zero]))
-        value = truncate_or_extend(builder, nb_value, eltype, value, buf.type.pointee)
-        builder.store(value, builder.gep(buf, [index]))
-
-    return sig, codegen
-
+    if isinstance(nb_value, types.Boolean):
+        kind = types.Boolean
+        value_bitwidth, buf_bitwidth = value.type.width, buf_typ.width
+    elif isinstance(nb_value, (types.Integer, types.Float)):
+        kind = types.Integer if isinstance(nb_value, types.Integer) else types.Float
+        value_bitwidth, buf_bitwidth = nb_value.bitwidth, eltype.bitwidth
+    else:
+        return value
+
+    if buf_bitwidth == value_bitwidth:
+        return value
+    if buf_bitwidth < value_bitwidth:
+        direction = 'narrow'  # truncate
+    elif kind is types.Integer:
+        direction = 'widen_signed' if nb_value.signed else 'widen_unsigned'  # extend
+    else:
+        direction = 'widen'  # extend
+    return getattr(builder, _cast_ops[kind, direction])(value, buf_typ)
 
-@extending.intrinsic
-def omnisci_buffer_setitem_(typingctx, data, index, value):
-    sig = types.none(data, index, value)
 
-    eltype = data.members[0].dtype
-    nb_value = value
+@typing.templates.infer_global(operator.setitem)
+class BufferSetItemTemplate(typing.templates.AbstractTemplate):
 
-    def codegen(context, builder, signature, args):
-        data, index, value = args
-        ptr = irutils.get_member_value(builder, data, 0)
-        value = truncate_or_extend(builder, nb_value, eltype, value, ptr.type.pointee)
+    def generic(self, args, kws):
+        if len(args) == 3 and not kws:
+            x, i, v = args
+            if isinstance(x, (BufferPointer, BufferType)) and isinstance(i, types.Integer):
+                return types.none(x, types.unliteral(i), types.unliteral(v))
 
-        builder.store(value, builder.gep(ptr, [index]))
 
-    return sig, codegen
+@extending.lower_builtin(operator.setitem, BufferPointer, types.Integer, types.Any)
+def omnisci_buffer_ptr_setitem_(context, builder, sig, args):
+    data, index, value = args
+    buf = _load_buffer_member(builder, data, 0)
+    value = truncate_or_extend(builder, sig.args[2], sig.args[0].eltype, value,
+                               buf.type.pointee)
+    _store_buffer_element(builder, value, buf, index)
 
 
-@extending.overload(operator.setitem)
-def omnisci_buffer_setitem(a, i, v):
-    if isinstance(a, BufferPointer):
-        return lambda a, i, v: omnisci_buffer_ptr_setitem_(a, i, v)
-    if isinstance(a, BufferType):
-        return lambda a, i, v: omnisci_buffer_setitem_(a, i, v)
+@extending.lower_builtin(operator.setitem, BufferType, types.Integer, types.Any)
+def omnisci_buffer_setitem_(context, builder, sig, args):
+    data, index, value = args
+    ptr = irutils.get_member_value(builder, data, 0)
+    value = truncate_or_extend(builder, sig.args[2], sig.args[0].eltype, value,
+                               ptr.type.pointee)
+    _store_buffer_element(builder, value, ptr, index)
 
 
 @extending.intrinsic
@@ -432,9 +547,8 @@ def omnisci_buffer_is_null_(typingctx, data):
     sig = types.int8(data)
 
     def codegen(context, builder, sig, args):
-        rawptr = cgutils.alloca_once_value(builder, value=args[0])
-        ptr = builder.load(rawptr)
-        return builder.load(builder.gep(ptr, [int32_t(0), int32_t(2)]))
+        data, = args
+        return _load_buffer_member(builder, data, 2)
 
     return sig, codegen
 
@@ -444,33 +558,57 @@ def omnisci_buffer_set_null_(typingctx, data):
     sig = types.none(data)
 
     def codegen(context, builder, sig, args):
-        rawptr = cgutils.alloca_once_value(builder, value=args[0])
-        ptr = builder.load(rawptr)
-        builder.store(int8_t(1), builder.gep(ptr, [int32_t(0), int32_t(2)]))
+        data, = args
+        _store_buffer_member(builder, int8_t(1), data, 2)
 
     return sig, codegen
 
 
+@functools.lru_cache(maxsize=None)
+def _null_value_constant(bitwidth, null_value):
+    # The server sends numbers as unsigned values rather than signed ones.
+    # Thus, 129 should be read as -127 (overflow). See rbc issue #254
+    null_value &= (1 << bitwidth) - 1
+    if null_value >> (bitwidth - 1):
+        null_value -= 1 << bitwidth
+    return ir.Constant(ir.IntType(bitwidth), null_value)
+
+
+def get_null_value_constant(T, null_value):
+    """Return the null value of scalar type T as an LLVM integer constant.
+
+    The constant has the bitwidth of T. Use bitcast to get the null
+    value of a floating-point type.
+    """
+    # the constant depends only on the bitwidth and the serialized
+    # value, so the types of the same size share the cache entries
+    return _null_value_constant(T.bitwidth, null_value)
+
+
+def get_null_value(T):
+    """Return the null value of scalar type T for the current target as
+    an LLVM integer constant.
+    """
+    return get_null_value_constant(T, TargetInfo().null_values[T.name])
+
+
 @extending.intrinsic
 def omnisci_buffer_idx_is_null_(typingctx, col_var, row_idx):
     T = col_var.eltype
     sig = types.boolean(col_var, row_idx)
 
-    target_info = TargetInfo()
-    null_value = target_info.null_values[str(T)]
-    # The server sends numbers as unsigned values rather than signed ones.
-    # Thus, 129 should be read as -127 (overflow). See rbc issue #254
-    nv = ir.Constant(ir.IntType(T.bitwidth), null_value)
+    nv = get_null_value(T)
 
     def codegen(context, builder, signature, args):
-        ptr, index = args
-        data = builder.extract_value(builder.load(ptr), [0])
-        res = builder.load(builder.gep(data, [index]))
+        data, index = args
+        ptr = _load_buffer_member(builder, data, 0)
+        res = _load_buffer_element(builder, ptr, index)
 
+        # compare the bit patterns of the element and the null value
         if isinstance(T, types.Float):
             res = builder.bitcast(res, nv.type)
 
-        return builder.icmp_signed('==', res, nv)
+        return builder.icmp_unsigned('==', res, nv)
 
     return sig, codegen
 
@@ -495,29 +633,16 @@ def omnisci_buffer_idx_set_null(typingctx, arr, row_idx):
     T = arr.eltype
     sig = types.none(arr, row_idx)
 
-    target_info = TargetInfo()
-    null_value = target_info.null_values[f'{T}']
-
-    # The server sends numbers as unsigned values rather than signed ones.
-    # Thus, 129 should be read as -127 (overflow). See rbc issue #254
-    bitwidth = T.bitwidth
-    null_value = np.dtype(f'uint{bitwidth}').type(null_value).view(f'int{bitwidth}')
+    nv = get_null_value(T)
 
     def codegen(context, builder, signature, args):
-        # get the operator.setitem intrinsic
-        fnop = context.typing_context.resolve_value_type(omnisci_buffer_ptr_setitem_)
-        setitem_sig = types.none(arr, row_idx, T)
-        # register the intrinsic in the typing ctx
-        fnop.get_call_type(context.typing_context, setitem_sig.args, {})
-        intrinsic = context.get_function(fnop, setitem_sig)
-
         data, index = args
-        # data = {T*, i64, i8}*
-        ty = data.type.pointee.elements[0].pointee
-        nv = ir.Constant(ir.IntType(T.bitwidth), null_value)
+        ptr = _load_buffer_member(builder, data, 0)
+
+        null_value = nv
         if isinstance(T, types.Float):
-            nv = builder.bitcast(nv, ty)
-        intrinsic(builder, (data, index, nv,))
+            null_value = builder.bitcast(nv, ptr.type.pointee)
+        _store_buffer_element(builder, null_value, ptr, index)
 
     return sig, codegen
 
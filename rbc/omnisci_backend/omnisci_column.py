@@ -9,7 +9,9 @@ __all__ = ['OutputColumn', 'Column', 'OmnisciOutputColumnType', 'OmnisciColumnTy
 
 from llvmlite import ir
 from rbc import typesystem, irutils
-from .omnisci_buffer import Buffer, OmnisciBufferType, BufferType
+from .omnisci_buffer import (Buffer, OmnisciBufferType, BufferType,
+                             get_null_value, _load_buffer_element,
+                             _store_buffer_element)
 from .column_list import OmnisciColumnListType
 from rbc.targetinfo import TargetInfo
 from numba.core import extending, types
@@ -54,18 +56,17 @@ def omnisci_column_set_null_(typingctx, col_var, row_idx):
     T = col_var.eltype
     sig = types.void(col_var, row_idx)
 
-    target_info = TargetInfo()
-    null_value = target_info.null_values[str(T)]
+    nv = get_null_value(T)
 
     def codegen(context, builder, signature, args):
         data, index = args
         ptr = irutils.get_member_value(builder, data, 0)
 
         ty = ptr.type.pointee
-        nv = ir.Constant(ir.IntType(T.bitwidth), null_value)
+        null_value = nv
         if isinstance(T, types.Float):
-            nv = builder.bitcast(nv, ty)
-        builder.store(nv, builder.gep(ptr, [index]))
+            null_value = builder.bitcast(nv, ty)
+        _store_buffer_element(builder, null_value, ptr, index)
 
     return sig, codegen
 
@@ -82,19 +83,17 @@ def omnisci_column_is_null_(typingctx, col_var, row_idx):
     T = col_var.eltype
     sig = types.boolean(col_var, row_idx)
 
-    target_info = TargetInfo()
-    null_value = target_info.null_values[str(T)]
-    nv = ir.Constant(ir.IntType(T.bitwidth), null_value)
+    nv = get_null_value(T)
 
     def codegen(context, builder, signature, args):
         data, index = args
         ptr = irutils.get_member_value(builder, data, 0)
-        res = builder.load(builder.gep(ptr, [index]))
+        res = _load_buffer_element(builder, ptr, index)
 
         if isinstance(T, types.Float):
             res = builder.bitcast(res, nv.type)
 
-        return builder.icmp_signed('==', res, nv)
+        return builder.icmp_unsigned('==', res, nv)
 
     return sig, codegen
 
@@ -1,5 +1,6 @@
-from .omnisci_buffer import BufferMeta, free_omnisci_buffer
-from numba.core import ir
+from .omnisci_buffer import BufferMeta, free_omnisci_buffer, free_buffer
+from numba.core import ir, errors
+from numba.core.ir_utils import guard, get_definition
 from numba.core.compiler import CompilerBase, DefaultPassBuilder
 from numba.core.compiler_machinery import FunctionPass, register_pass
 from numba.core.untyped_passes import IRProcessing, DeadBranchPrune, SimplifyCFG
@@ -21,6 +22,8 @@ class FreeOmnisciBuffer(FunctionPass):
     def run_pass(self, state):
         func_ir = state.func_ir  # get the FunctionIR object
 
+        freed = self.find_freed_buffers(func_ir)
+
         for blk in func_ir.blocks.values():
             for stmt in blk.find_insts(ir.Assign):
                 if (
@@ -39,6 +42,14 @@ class FreeOmnisciBuffer(FunctionPass):
             scope = blk.scope
             for ret in blk.find_insts(ir.Return):
 
+                value = guard(get_definition, func_ir, ret.value)
+                if isinstance(value, ir.Expr) and value.op == 'cast':
+                    constructor = self.get_buffer_constructor(func_ir, value.value)
+                    if any(constructor is c for c in freed):
+                        raise errors.UnsupportedError(
+                            f'returning buffer {value.value.name!r} that is freed'
+                            ' explicitly is not supported', ret.loc)
+
                 name = "free_omnisci_buffer_fn"
                 value = ir.Global(name, free_omnisci_buffer, loc)
                 target = scope.make_temp(loc)
@@ -53,6 +64,51 @@ class FreeOmnisciBuffer(FunctionPass):
 
         return True  # we changed the IR
 
+    def get_buffer_constructor(self, func_ir, var):
+        """Return the buffer constructor call expression that defines
+        the variable var, or None when var is not defined by a buffer
+        constructor call (e.g. var is an argument).
+        """
+        value = guard(get_definition, func_ir, var)
+        if isinstance(value, ir.Expr) and value.op == 'call':
+            func = guard(get_definition, func_ir, value.func)
+            if (isinstance(func, (ir.Global, ir.FreeVar))
+                    and func.name in BufferMeta.class_names):
+                return value
+        return None
+
+    def find_freed_buffers(self, func_ir):
+        """Return the constructor call expressions of buffers that are
+        freed explicitly with `a.free()` or `free_buffer(a)`.
+
+        Raise UnsupportedError when the freed buffer is not constructed
+        within the UDF/UDTF.
+        """
+        freed = []
+        for blk in func_ir.blocks.values():
+            for stmt in blk.find_insts(ir.Assign):
+                value = stmt.value
+                if not isinstance(value, ir.Expr):
+                    continue
+                if value.op == 'getattr' and value.attr == 'free':
+                    var = value.value
+                elif value.op == 'call' and len(value.args) == 1:
+                    func = guard(get_definition, func_ir, value.func)
+                    if not (isinstance(func, (ir.Global, ir.FreeVar))
+                            and func.value is free_buffer):
+                        continue
+                    var = value.args[0]
+                else:
+                    continue
+                constructor = self.get_buffer_constructor(func_ir, var)
+                if constructor is None:
+                    raise errors.UnsupportedError(
+                        f'freeing buffer {var.name!r} is not supported, only'
+                        ' buffers constructed within UDF/UDTF can be freed',
+                        value.loc)
+                freed.append(constructor)
+        return freed
+
 
 class OmnisciCompilerPipeline(CompilerBase):
     def define_pipelines(self):
@@ -395,6 +395,35 @@ def test_array_constructor_return(omnisci):
                  list(map(float, reversed(range(10)))))
 
 
+def test_array_constructor_free(omnisci):
+    if omnisci.has_cuda:
+        pytest.skip('buffers are freed with stdlib free that works only on CPU')
+
+    omnisci.reset()
+
+    from rbc.omnisci_backend import Array, free_buffer
+    from numba import types
+
+    @omnisci('float64[](int32)')
+    def array_free(size):
+        a = Array(size, types.float64)
+        b = Array(size, types.float64)
+        c = Array(size, types.float64)
+        for i in range(size):
+            a[i] = float(i)
+            b[i] = 2.0
+            c[i] = a[i] * b[i]
+        a.free()
+        free_buffer(b)
+        return c
+
+    query = 'select array_free(5)'
+    _, result = omnisci.sql_execute(query)
+
+    r = list(result)[0]
+    assert r == ([0.0, 2.0, 4.0, 6.0, 8.0],)
+
+
 def test_array_constructor_len(omnisci):
     omnisci.reset()
 
@@ -450,6 +479,12 @@ def test_array_constructor_is_null(omnisci):
 
     assert list(result)[0] == (0,)
 
+    # empty arrays are not null
+    query = 'select array_is_null(0);'
+    _, result = omnisci.sql_execute(query)
+
+    assert list(result)[0] == (0,)
+
 
 inps = [('int32', 'i4', 'trunc'), ('int32', 'i4', 'sext'),
         ('int32', 'i4', 'zext'), ('float', 'f4', 'fptrunc'),
@@ -0,0 +1,370 @@
+import gc
+import operator
+import re
+import pytest
+from llvmlite import ir
+from rbc import irtools
+from rbc.targetinfo import TargetInfo
+from rbc.typesystem import Type
+from rbc.omnisci_backend import Array, free_buffer, omnisci_buffer
+from rbc.omnisci_backend.omnisci_array import OmnisciArrayType
+from rbc.omnisci_backend.omnisci_column import OmnisciColumnType
+from rbc.omnisci_backend.omnisci_pipeline import OmnisciCompilerPipeline
+from numba.core import registry, types
+from numba.core.errors import TypingError, UnsupportedError
+
+
+@pytest.fixture(scope='module')
+def target_context():
+    return registry.cpu_target.target_context
+
+
+@pytest.fixture(scope='module')
+def array_type():
+    with TargetInfo.host():
+        return OmnisciArrayType((Type.fromstring('int32'),)).tonumba()
+
+
+def generate_ir(target_context, impl, sig):
+    """Return LLVM IR of a function that calls the lowering
+    implementation impl with given signature.
+    """
+    module = ir.Module()
+    fnty = ir.FunctionType(target_context.get_value_type(sig.return_type),
+                           [target_context.get_value_type(t) for t in sig.args])
+    fn = ir.Function(module, fnty, name='f')
+    builder = ir.IRBuilder(fn.append_basic_block('entry'))
+    res = impl(target_context, builder, sig, fn.args)
+    if isinstance(sig.return_type, types.NoneType):
+        builder.ret_void()
+    else:
+        builder.ret(res)
+    return str(fn)
+
+
+def intrinsic_impl(intrinsic, *argtypes):
+    sig, codegen = intrinsic._defn(None, *argtypes)
+    return codegen, sig
+
+
+@pytest.mark.parametrize('name', ['ptr_get_ptr_', 'ptr_len_', 'is_null_', 'set_null_',
+                                  'ptr_item_get_ptr_', 'ptr_getitem_', 'ptr_setitem_'])
+def test_buffer_ptr_no_alloca(target_context, array_type, name):
+    # BufferPointer intrinsics must access the buffer members
+    # directly, without storing the pointer to a stack slot
+    impl = getattr(omnisci_buffer, f'omnisci_buffer_{name}')
+    if name == 'ptr_len_':
+        sig = types.int64(array_type)
+    elif name == 'ptr_getitem_':
+        sig = array_type.eltype(array_type, types.int64)
+    elif name == 'ptr_setitem_':
+        sig = types.none(array_type, types.int64, types.int32)
+    else:
+        argtypes = [array_type]
+        if 'item' in name:
+            argtypes.append(types.int64)
+        impl, sig = intrinsic_impl(impl, *argtypes)
+    llvm_ir = generate_ir(target_context, impl, sig)
+    assert 'alloca' not in llvm_ir
+
+
+@pytest.mark.parametrize('T, null_value, expected', [
+    (types.int8, 128, -128),
+    (types.int8, 127, 127),
+    (types.int16, 32768, -32768),
+    (types.int32, 2147483648, -2147483648),
+    (types.int64, 9223372036854775808, -9223372036854775808),
+    (types.float32, 8388608, 8388608),
+])
+def test_null_value_constant(T, null_value, expected):
+    nv = omnisci_buffer.get_null_value_constant(T, null_value)
+    assert nv.type == ir.IntType(T.bitwidth)
+    assert nv.constant == expected
+    assert omnisci_buffer.get_null_value_constant(T, null_value) is nv
+
+
+def test_null_value():
+    with TargetInfo.dummy() as target_info:
+        target_info.set('null_values', {'int32': 2147483648, 'float32': 8388608,
+                                        'int16': 32768})
+        nv = omnisci_buffer.get_null_value(types.int32)
+        assert nv.constant == -2147483648
+        # the null value constants are shared by the types of the
+        # same bitwidth
+        assert omnisci_buffer.get_null_value_constant(types.uint32, 2147483648) is nv
+        assert omnisci_buffer.get_null_value(types.float32).constant == 8388608
+        assert omnisci_buffer.get_null_value(types.int16).constant == -32768
+
+
+@pytest.mark.parametrize('nb_value, eltype, expected', [
+    (types.int64, types.int32, 'trunc'),
+    (types.int8, types.int32, 'sext'),
+    (types.uint8, types.int32, 'zext'),
+    (types.int32, types.int32, None),
+    (types.float64, types.float32, 'fptrunc'),
+    (types.float32, types.float64, 'fpext'),
+    (types.float64, types.float64, None),
+    (types.boolean, types.int8, 'zext'),
+])
+def test_truncate_or_extend(target_context, nb_value, eltype, expected):
+    module = ir.Module()
+    value_type = target_context.get_value_type(nb_value)
+    buf_type = target_context.get_data_type(eltype)
+    fn = ir.Function(module, ir.FunctionType(buf_type, [value_type]), name='f')
+    builder = ir.IRBuilder(fn.append_basic_block('entry'))
+    [value] = fn.args
+    res = omnisci_buffer.truncate_or_extend(builder, nb_value, eltype, value, buf_type)
+    if expected is None:
+        assert res is value
+    else:
+        assert res.opname == expected
+        assert res.type == buf_type
+
+
+def test_buffer_alloc_fn_attributes():
+    module = ir.Module()
+    alloc_fn = omnisci_buffer.get_buffer_alloc_fn(module)
+    assert 'noalias' in alloc_fn.return_value.attributes
+    assert alloc_fn.return_value.attributes.align == 8
+    assert 'nounwind' not in alloc_fn.attributes
+    assert omnisci_buffer.get_buffer_alloc_fn(module) is alloc_fn
+
+
+def test_buffer_constructor_single_store(target_context, array_type):
+    sig = array_type(types.int64, types.StringLiteral('int32'))
+    module = ir.Module()
+    fnty = ir.FunctionType(ir.VoidType(), [ir.IntType(64)])
+    fn = ir.Function(module, fnty, name='construct')
+    builder = ir.IRBuilder(fn.append_basic_block('entry'))
+    try:
+        omnisci_buffer.omnisci_buffer_constructor(target_context, builder, sig, fn.args)
+    finally:
+        omnisci_buffer.builder_buffers.pop(builder, None)
+    builder.ret_void()
+    # numba zero-fills stack slots on allocation, skip these stores
+    stores = [instr for instr in fn.blocks[0].instructions
+              if instr.opname == 'store' and not isinstance(instr.operands[0], ir.Constant)]
+    assert len(stores) == 1
+    assert stores[0].operands[0].type == target_context.get_data_type(array_type.dtype)
+    # new buffers, including the empty ones, are not null
+    [is_null] = [instr for instr in fn.blocks[0].instructions
+                 if instr.opname == 'insertvalue' and list(instr.indices) == [2]]
+    assert is_null.value.constant == 0
+
+
+def test_buffer_typing_templates(array_type):
+    typing_context = registry.cpu_target.typing_context
+    typing_context.refresh()
+    eltype = array_type.eltype
+
+    sig = typing_context.resolve_function_type(len, (array_type,), {})
+    assert sig == types.int64(array_type)
+
+    sig = typing_context.resolve_function_type(
+        operator.getitem, (array_type, types.IntegerLiteral(1)), {})
+    assert sig == eltype(array_type, types.int64)
+
+    sig = typing_context.resolve_function_type(
+        operator.setitem, (array_type, types.int32, types.float64), {})
+    assert sig == types.none(array_type, types.int32, types.float64)
+
+    with pytest.raises(TypingError):
+        typing_context.resolve_function_type(
+            operator.getitem, (array_type, types.float64), {})
+
+
+def test_builder_buffers_released(target_context, array_type):
+    # buffers of a builder for which free_omnisci_buffer is never
+    # called must not be kept alive
+    sig = array_type(types.int64, types.StringLiteral('int32'))
+    module = ir.Module()
+    fn = ir.Function(module, ir.FunctionType(ir.VoidType(), [ir.IntType(64)]), name='f')
+    builder = ir.IRBuilder(fn.append_basic_block('entry'))
+    count = len(omnisci_buffer.builder_buffers)
+    omnisci_buffer.omnisci_buffer_constructor(target_context, builder, sig, fn.args)
+    assert len(omnisci_buffer.builder_buffers[builder]) == 1
+    assert len(omnisci_buffer.builder_buffers) == count + 1
+    del builder
+    gc.collect()
+    assert len(omnisci_buffer.builder_buffers) == count
+
+
+@pytest.mark.parametrize('T, null_value', [('int32', 2147483648), ('float32', 8388608)])
+def test_buffer_ptr_idx_is_null(target_context, T, null_value):
+    with TargetInfo.dummy() as target_info:
+        target_info.set('null_values', {T: null_value})
+        array_type = OmnisciArrayType((Type.fromstring(T),)).tonumba()
+        impl, sig = intrinsic_impl(omnisci_buffer.omnisci_buffer_idx_is_null_,
+                                   array_type, types.int64)
+    llvm_ir = generate_ir(target_context, impl, sig)
+    # only the data pointer member and the element are loaded, the
+    # null check is a single integer comparison
+    assert llvm_ir.count('load ') == 2
+    assert 'load {' not in llvm_ir
+    assert llvm_ir.count('icmp eq') == 1
+    assert 'alloca' not in llvm_ir
+
+
+def compile_udf(func, signature, target_name='test_omnisci_buffer_cpu'):
+    """Return optimized LLVM IR of a UDF compiled for the host
+    target. The Array class must be a free variable of func to enable
+    freeing the buffers created within the UDF.
+    """
+    with TargetInfo.host(name=target_name) as target_info:
+        target_info.set('null_values', {'int32': 2147483648})
+        target_info.set('software', 'OmnisciDB 5.8.0')
+        target_info.add_library('omniscidb')
+        with Type.alias(Array='OmnisciArrayType'):
+            sig = Type.fromstring(signature)
+            sig.set_mangling('')
+            module, fids = irtools.compile_to_LLVM(
+                [(func, {0: sig})], target_info,
+                pipeline_class=OmnisciCompilerPipeline)
+    assert fids == [0]
+    return str(module)
+
+
+def test_buffer_ptr_idx_is_null_vectorized():
+    def make(Array):
+        def is_null_loop(a, n):
+            out = Array(n, 'int8')
+            for i in range(n):
+                out[i] = a.is_null(i)
+            return out
+        return is_null_loop
+
+    llvm_ir = compile_udf(make(Array), 'Array<int8>(Array<int32>, int32)')
+    # the elements are compared to the null value with vector instructions
+    assert re.search(r'icmp eq <\d+ x i32>', llvm_ir)
+
+
+@pytest.mark.parametrize('T, null_value', [('int32', 2147483648), ('float64', 4503599627370496)])
+def test_buffer_ptr_idx_set_null(target_context, T, null_value):
+    with TargetInfo.dummy() as target_info:
+        target_info.set('null_values', {T: null_value})
+        array_type = OmnisciArrayType((Type.fromstring(T),)).tonumba()
+        impl, sig = intrinsic_impl(omnisci_buffer.omnisci_buffer_idx_set_null,
+                                   array_type, types.int64)
+    llvm_ir = generate_ir(target_context, impl, sig)
+    # the null value is stored directly to the element
+    assert llvm_ir.count('load ') == 1
+    assert llvm_ir.count('store ') == 1
+    assert 'alloca' not in llvm_ir
+
+
+def test_buffer_ptr_setitem_tbaa(target_context, array_type):
+    # storing an element must not be considered to modify the buffer
+    # data pointer, otherwise its load is not hoisted out of loops
+    module = ir.Module()
+    fnty = ir.FunctionType(ir.VoidType(), [target_context.get_value_type(array_type),
+                                           ir.IntType(64), ir.IntType(32)])
+    fn = ir.Function(module, fnty, name='f')
+    builder = ir.IRBuilder(fn.append_basic_block('entry'))
+    sig = types.none(array_type, types.int64, types.int32)
+    omnisci_buffer.omnisci_buffer_ptr_setitem_(target_context, builder, sig, fn.args)
+    builder.ret_void()
+    [load] = [instr for instr in fn.blocks[0].instructions if instr.opname == 'load']
+    [store] = [instr for instr in fn.blocks[0].instructions if instr.opname == 'store']
+    assert load.metadata['tbaa'] is not store.metadata['tbaa']
+    assert load.metadata['tbaa'] is omnisci_buffer._tbaa_tag(module, 'buffer member')
+    assert store.metadata['tbaa'] is omnisci_buffer._tbaa_tag(module, 'buffer element')
+
+
+def test_buffer_tonumba_cache():
+    with TargetInfo.host():
+        int32 = Type.fromstring('int32')
+        array_type = OmnisciArrayType((int32,)).tonumba()
+        assert OmnisciArrayType((Type.fromstring('int32'),)).tonumba() is array_type
+        assert OmnisciArrayType((Type.fromstring('int64'),)).tonumba() is not array_type
+        # the numba type of Column depends on the omniscidb version
+        column_types = []
+        for software in ['OmnisciDB 5.7.0', 'OmnisciDB 5.8.0']:
+            with TargetInfo.dummy() as target_info:
+                target_info.set('software', software)
+                column_types.append(OmnisciColumnType((int32,)).tonumba())
+    assert isinstance(column_types[0], omnisci_buffer.BufferType)
+    assert isinstance(column_types[1], omnisci_buffer.BufferPointer)
+
+
+def test_buffer_free(target_context, array_type):
+    impl, sig = intrinsic_impl(omnisci_buffer.omnisci_buffer_free_, array_type)
+    llvm_ir = generate_ir(target_context, impl, sig)
+    # the buffer is freed directly and it is reset to an empty buffer
+    # so that it is not freed again when leaving the UDF/UDTF
+    assert llvm_ir.count('call void @"free"') == 1
+    assert 'store i32* null' in llvm_ir
+    assert 'store i64 0' in llvm_ir
+    assert 'alloca' not in llvm_ir
+
+
+def test_buffer_free_udf():
+    def make(Array):
+        def free_udf(n):
+            a = Array(n, 'int32')
+            b = Array(n, 'int32')
+            c = Array(n, 'int32')
+            for i in range(n):
+                a[i] = i
+                b[i] = 2
+                c[i] = a[i] * b[i]
+            a.free()
+            free_buffer(b)
+            return c
+        return free_udf
+
+    llvm_ir = compile_udf(make(Array), 'Array<int32>(int32)')
+    # the explicitly freed buffers are not freed again when leaving
+    # the UDF, the returned buffer is not freed
+    assert llvm_ir.count('call void @free(') == 2
+    assert 'llvm.memset' not in llvm_ir
+
+
+def test_buffer_free_returned():
+    def make(Array):
+        def free_udf(n):
+            a = Array(n, 'int32')
+            a.free()
+            return a
+        return free_udf
+
+    with pytest.raises(UnsupportedError, match='freed explicitly'):
+        compile_udf(make(Array), 'Array<int32>(int32)')
+
+
+def test_buffer_free_returned_alias():
+    def make(Array):
+        def free_udf(n):
+            a = Array(n, 'int32')
+            d = a
+            a.free()
+            return d
+        return free_udf
+
+    with pytest.raises(UnsupportedError, match='freed explicitly'):
+        compile_udf(make(Array), 'Array<int32>(int32)')
+
+
+def test_buffer_free_argument():
+    def make(Array):
+        def free_udf(a, n):
+            b = Array(n, 'int32')
+            a.free()
+            return b
+        return free_udf
+
+    with pytest.raises(UnsupportedError, match='constructed within UDF/UDTF'):
+        compile_udf(make(Array), 'Array<int32>(Array<int32>, int32)')
+
+
+def test_buffer_free_gpu():
+    def make(Array):
+        def free_udf(n):
+            a = Array(n, 'int32')
+            b = Array(n, 'int32')
+            a.free()
+            return b
+        return free_udf
+
+    with pytest.raises(TypingError, match='only on CPU'):
+        compile_udf(make(Array), 'Array<int32>(int32)',
+                    target_name='test_omnisci_buffer_gpu')